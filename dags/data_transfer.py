@@ -4,21 +4,30 @@ import sys
 # sys.path.insert(0, 'scripts/')
 
 from airflow.models import DAG
+from airflow.exceptions import AirflowException
 from airflow.utils.dates import days_ago
 from airflow.operators.python_operator import PythonOperator
+from airflow.operators.dummy_operator import DummyOperator
 from datetime import datetime, timedelta
 
 from scripts import (
     upload_to_s3,
-    download_to_mongo
+    download_and_stage_data,
+    upload_staged_data
 )
 
 
-def upload_amplitude_data():
-    upload_to_s3()
+def upload_amplitude_data(date):
+    # upload_to_s3 reports failures in its result, fail the task so Airflow retries the export
+    result = upload_to_s3(date)
+    if result['statusCode'] != 200:
+        raise AirflowException(f'Amplitude export for {date} failed')
 
-def download_s3_data():
-    download_to_mongo()
+def download_s3_data(date):
+    download_and_stage_data(date)
+
+def upload_environment_data(collection_name, date):
+    upload_staged_data(collection_name, date)
 
 default_args = {
     'owner': 'Lydia',
@@ -33,19 +42,38 @@ default_args = {
 data_transfer_dag = DAG(
     dag_id='prepare_data',
     default_args=default_args,
-    schedule_interval='@daily'
+    schedule_interval='@daily',
+    catchup=False # runs export their own {{ ds }}, so don't backfill every day since start_date
 )
 
 upload_amplitude_data_task = PythonOperator(
     task_id='upload_amplitude_data',
     python_callable=upload_amplitude_data,
+    op_kwargs={'date': '{{ ds_nodash }}'},
     dag=data_transfer_dag
 )
 
 download_s3_data_task = PythonOperator(
     task_id='download_s3_data',
     python_callable=download_s3_data,
+    op_kwargs={'date': '{{ ds }}'},
+    dag=data_transfer_dag
+)
+
+done_task = DummyOperator(
+    task_id='done',
     dag=data_transfer_dag
 )
 
 upload_amplitude_data_task >> download_s3_data_task
+
+# Each environment is uploaded by its own task, the mongo_write_pool caps the concurrent Atlas writers
+for collection_name in ['staging', 'beta', 'production']:
+    upload_environment_data_task = PythonOperator(
+        task_id=f'upload_{collection_name}_data',
+        python_callable=upload_environment_data,
+        op_kwargs={'collection_name': collection_name, 'date': '{{ ds }}'},
+        pool='mongo_write_pool',
+        dag=data_transfer_dag
+    )
+    download_s3_data_task >> upload_environment_data_task >> done_task
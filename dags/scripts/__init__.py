@@ -1,2 +1,7 @@
 from .amplitude_to_s3_upload import upload_to_s3
-from .s3_to_mongo_download import download_to_mongo
+from .s3_to_mongo_download import (
+    download_to_mongo,
+    download_and_stage_data,
+    upload_staged_data,
+    ensure_indexes
+)
@@ -1,4 +1,5 @@
 import traceback
+import io
 import requests
 import shutil
 import zipfile
@@ -10,44 +11,45 @@ import logging
 from decouple import config
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from concurrent.futures import ThreadPoolExecutor
 
 project_id = config('DATA_PATH')
-base_path = "/tmp/amplitude_data/"
-project_directory = base_path + project_id
-extracted_json_data = base_path + "extracted/"
 zip_file_path = "/tmp/amplitude_data.zip"
 amplitude_key = config("AMPLITUDE_API_KEY")
 amplitude_secret = config("AMPLITUDE_SECRET_KEY")
 
+UPLOAD_WORKERS = 16
+MAX_IN_MEMORY_EXPORT_SIZE = 1024 * 1024 * 1024 # 1GB
+COPY_CHUNK_SIZE = 1024 * 1024 # 1MB
+# The members are already uploaded in parallel, so each upload runs in its worker thread
+transfer_config = TransferConfig(use_threads=False)
+
 logger = logging.getLogger(__name__)
 
 
-def upload_to_s3(): 
+class NonSeekableStream:
+    # GzipFile reports itself as seekable, so s3transfer would seek to the end to find its size,
+    # decompressing the member once just for that. Only exposing read makes it stream the data instead.
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+def upload_to_s3(date=None):
     try:
-        date = get_today_date()
+        date = date or get_today_date()
         print(date)
         url = f'https://amplitude.com/api/2/export?start={date}T1&end={date}T23'
         response = requests.get(url, auth=HTTPBasicAuth(amplitude_key, amplitude_secret), stream=True)
         logging.info(response.status_code)
-        with open(zip_file_path, 'wb') as out_file:
-            shutil.copyfileobj(response.raw, out_file)
+        archive = read_export(response)
         del response
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(base_path)
-
-        if not os.path.exists(extracted_json_data):
-            os.makedirs(extracted_json_data)
-
-        for filename in os.listdir(project_directory):
-            if not filename.endswith(".gz"):
-                continue
-            file_path = os.path.join(project_directory, filename)
-            with gzip.open(file_path, 'rb') as f_in:
-                json_file_name = filename[:-3]
-                with open(extracted_json_data + json_file_name, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-        upload_files_s3(extracted_json_data)
+        with zipfile.ZipFile(archive, 'r') as zip_ref:
+            upload_files_s3(zip_ref)
         return {'statusCode': 200, "body": {"message": "success"}}
     except Exception as e:
         logging.error("error while handling lambda event ")
@@ -55,20 +57,40 @@ def upload_to_s3():
         return {'statusCode': 500, "body": {"message": "Failed"}}
 
 
+def read_export(response):
+    # Keep the archive in memory when it is small enough, otherwise spool it to disk
+    response.raw.decode_content = True # undo any HTTP content encoding so only the zip bytes are copied
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None and int(content_length) <= MAX_IN_MEMORY_EXPORT_SIZE:
+        buffer = io.BytesIO()
+        shutil.copyfileobj(response.raw, buffer, COPY_CHUNK_SIZE)
+        buffer.seek(0)
+        return buffer
+    with open(zip_file_path, 'wb') as out_file:
+        shutil.copyfileobj(response.raw, out_file, COPY_CHUNK_SIZE)
+    return zip_file_path
+
+
 def get_today_date():
     return (datetime.now() - timedelta(days=0)).strftime("%Y%m%d")
 
 
-def upload_files_s3(directory_path):
+def upload_files_s3(zip_ref):
     logging.info("Uploading files to S3")
 
     bucket = config("S3_BUCKET_NAME")
-    s3_client = boto3.client('s3', config=Config(signature_version='s3v4', s3={'addressing_style': 'path'}), region_name='eu-north-1')
-
-    for filename in os.listdir(directory_path):
-        if not filename.endswith(".json"):
-            continue
-        file_path = os.path.join(directory_path, filename)
-        s3_key = f"amplitude/{filename}"
-        with open(file_path, 'rb') as data:
-            s3_client.upload_fileobj(data, bucket, s3_key, ExtraArgs={'ContentType': 'application/json'})
\ No newline at end of file
+    s3_client = boto3.client('s3', config=Config(signature_version='s3v4', s3={'addressing_style': 'path'}, max_pool_connections=UPLOAD_WORKERS), region_name='eu-north-1')
+
+    # Stream the project's gz members straight out of the archive instead of extracting them to disk
+    gz_members = [info for info in zip_ref.infolist()
+                  if info.filename.endswith(".gz") and os.path.dirname(info.filename) == project_id]
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        # Consume the results so that a failed upload is raised here
+        list(executor.map(lambda info: upload_gz_member(s3_client, bucket, zip_ref, info), gz_members))
+
+
+def upload_gz_member(s3_client, bucket, zip_ref, info):
+    # Decompress while uploading rather than writing the extracted json to disk first
+    s3_key = f"amplitude/{os.path.basename(info.filename)[:-3]}"
+    with zip_ref.open(info) as gz_raw, gzip.open(gz_raw, 'rb') as data:
+        s3_client.upload_fileobj(NonSeekableStream(data), bucket, s3_key, ExtraArgs={'ContentType': 'application/json'}, Config=transfer_config)